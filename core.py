@@ -0,0 +1,231 @@
+"""
+Data loading and plotting utilities for the PopART-IBM dashboard
+
+Author: p-robot
+"""
+
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+import numpy as np
+import pandas as pd
+from pyarrow import csv as pacsv
+import streamlit as st
+from defaults import SUMMARY_COLS, DEFAULT_PERIOD, SUMMARY_SUFFIX
+
+# altair is imported when the first chart is built, keeping it off the startup path
+if TYPE_CHECKING:
+    import altair as alt
+
+plotting_dict = {
+    'Incidence': {'name': 'HIV incidence',
+                  'var': 'Incidence',
+                  'col': '#D55E00'},
+
+    'NewCasesThisYear': {'name': 'New HIV infections',
+                         'var': 'NewCasesThisYear',
+                         'col': '#D55E00'},
+
+    'Prevalence': {'name': 'HIV prevalence',
+                   'var': 'Prevalence',
+                   'col': '#D55E00'},
+
+    'PLHIV': {'name': 'Number of people living with HIV', 
+              'var': ['NumberPositiveM', 'NumberPositiveF', 'NumberPositive'],
+              'codes': ['Men', 'Women', 'Total'],
+              'col': ["#D55E00", "#0072B2", "#009E73"]},
+
+    'HIVDeaths': {'name': 'HIV-related deaths', 
+              'var': ['NDied_from_HIV', 'NHIV_pos_dead'],
+              'codes': ['Deaths from HIV-related causes', 'Deaths of PLHIV'],
+              'col': ["#D55E00", "#0072B2"]},
+}
+
+# Normalise entries so that 'var', 'col' and 'codes' are always aligned lists
+for v in plotting_dict.values():
+    v['var'] = v['var'] if isinstance(v['var'], list) else [v['var']]
+    v['col'] = v['col'] if isinstance(v['col'], list) else [v['col']]
+    v.setdefault('codes', [v['name']])
+
+# Columns read from each output file (everything the dashboard displays) and their types
+DTYPES = {'Year': 'int16',
+          'Incidence': 'float32',
+          'Prevalence': 'float32',
+          'NewCasesThisYear': 'int32',
+          'NumberPositive': 'int32',
+          'NumberPositiveM': 'int32',
+          'NumberPositiveF': 'int32',
+          'NDied_from_HIV': 'int32',
+          'NHIV_pos_dead': 'int32',
+          'N_dead': 'int32',
+          'TotalPopulation': 'int32',
+          'PopulationF': 'int32',
+          'PopulationM': 'int32'}
+USECOLS = list(DTYPES)
+
+# Maximum number of entries kept by caches keyed on the period to show (one per slider 
+# position), so dragging the slider doesn't grow them for the life of the server
+MAX_CACHE_ENTRIES = 64
+
+# Maximum number of rows shown in data tables (the full data can be downloaded)
+MAX_TABLE_ROWS = 200
+
+
+
+@st.cache_data(ttl=60)
+def list_output_files(output_dir: str) -> list:
+    """
+    Output files (CSV or Parquet) in output_dir, rescanned at most once a minute
+    """
+    return sorted(f for f in os.listdir(output_dir) 
+        if f.endswith((".csv", ".parquet")) and not f.endswith(SUMMARY_SUFFIX))
+
+
+@st.cache_data
+def load_output(path: str) -> pd.DataFrame:
+    """
+    Read a PopART-IBM output file (CSV or Parquet), cached across reruns and sessions
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=USECOLS, engine='pyarrow').astype(DTYPES)
+    table = pacsv.read_csv(path,
+        read_options = pacsv.ReadOptions(use_threads=True),
+        convert_options = pacsv.ConvertOptions(include_columns=USECOLS, column_types=DTYPES))
+    # One block per column avoids the consolidation copy, and Arrow buffers are 
+    # released as each column is converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def year_slice(df: pd.DataFrame, start: int, end: int) -> pd.DataFrame:
+    """
+    Rows of an output file with Year in [start, end], found by binary search 
+    (PopART-IBM output files are sorted by Year)
+    """
+    i, j = np.searchsorted(df['Year'].to_numpy(), [start, end + 1])
+    return df.iloc[i:j]
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES)
+def load_period(path: str, start: int, end: int) -> pd.DataFrame:
+    """
+    Read the rows of an output file that fall within [start, end]
+    """
+    return year_slice(load_output(path), start, end)
+
+
+def downsample(df: pd.DataFrame, n: int = 800) -> pd.DataFrame:
+    """
+    Keep at most n (plus the last) evenly spaced rows of a DataFrame for plotting
+    """
+    if len(df) <= n:
+        return df
+    # Ceiling step so no more than n rows are kept; keep the last row so lines reach the end
+    idx = np.arange(0, len(df), -(-len(df)//n))
+    if idx[-1] != len(df) - 1:
+        idx = np.append(idx, len(df) - 1)
+    return df.iloc[idx]
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES)
+def load_long(path: str, start: int, end: int) -> pd.DataFrame:
+    """
+    Long-form (Year, series, value) version of the period to show, for multi-line charts
+    """
+    return downsample(load_period(path, start, end)).melt(
+        'Year', value_name = 'value', var_name = 'series')
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES)
+def summary(path: str, start: int, end: int) -> tuple:
+    """
+    Indicators shown in the metric tiles: incidence (%), PLHIV and population size
+    """
+    m = load_period(path, start, end)[SUMMARY_COLS].to_numpy().max(axis=0)
+    return float(np.round(m[0]*100, 2)), int(m[1]), int(m[2])
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES)
+def precomputed_summary(path: str, start: int, end: int) -> tuple:
+    """
+    As summary(), but from the precomputed summary file (see scripts/summarize.py) when 
+    it is up to date and covers the same period, so the output file isn't read at all.  
+    Only worth it for files that are not also plotted (the surrounding area).
+    """
+    summary_path = path + SUMMARY_SUFFIX
+    if os.path.exists(summary_path) and os.path.getmtime(summary_path) >= os.path.getmtime(path):
+        s = pd.read_parquet(summary_path).iloc[0]
+        if (s['start'], s['end']) == (start, end):
+            return float(s['inc']), int(s['plhiv']), int(s['pop'])
+    return summary(path, start, end)
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES)
+def table_csv(path: str, start: int, end: int, var: str) -> bytes:
+    """
+    CSV of the data of one variable in plotting_dict over the period to show, for download
+    """
+    cols = ['Year'] + plotting_dict[var]['var']
+    return load_period(path, start, end)[cols].to_csv(index=False).encode('utf-8')
+
+
+def add_single_line_chart(data: pd.DataFrame, x: str, y: str, line_color: str) -> alt.Chart:
+    """
+    Create a line chart with one variable
+    """
+    import altair as alt
+
+    # Only the plotted columns are sent to the browser
+    output_chart = (alt.Chart(data[[x, y]]).mark_line(color=line_color).encode(
+                x=alt.X(x, axis=alt.Axis(format='.0f')),
+                y = y)
+                ).configure_legend(orient='bottom')
+    return(output_chart)
+
+
+def add_multiple_line_chart(data: pd.DataFrame, x: str, y: list, 
+                            value_name: str, var_name: str, line_color: list,
+                            codes: list) -> alt.Chart:
+    """
+    Create a line chart with multiple variables from long-form data (see load_long)
+    """
+    import altair as alt
+
+    # Select the series to plot
+    df_melt = data[data['series'].isin(y)].rename(
+        columns = {'value': value_name, 'series': var_name})
+    
+    # Recode if needed
+    df_melt[var_name] = df_melt[var_name].map(dict(zip(y, codes)))
+
+    # A single series needs no legend (as with add_single_line_chart)
+    col_var = alt.Color(var_name,
+        scale=alt.Scale(
+        domain=codes,
+        range=line_color),
+        legend=None if len(y) == 1 else alt.Undefined)
+    
+    chart = (alt.Chart(df_melt).mark_line().encode(
+        x=alt.X(x, axis=alt.Axis(format='.0f')),
+        y = value_name,
+        color = col_var)
+        ).configure_legend(orient='bottom')
+    return(chart)
+
+
+@st.cache_resource(max_entries=MAX_CACHE_ENTRIES)
+def build_chart(path: str, start: int, end: int, var: str) -> alt.Chart:
+    """
+    Create the chart of one variable in plotting_dict, cached on file, period and variable
+    """
+    # Single series are labelled by their column on the y-axis, as before normalisation
+    y = plotting_dict[var]['var']
+    chart = add_multiple_line_chart(load_long(path, start, end),
+                                    x = 'Year', 
+                                    y = y,
+                                    value_name = y[0] if len(y) == 1 else 'Value',
+                                    var_name = plotting_dict[var]['name'],
+                                    line_color = plotting_dict[var]['col'],
+                                    codes = plotting_dict[var]['codes'])
+    return(chart)
+
@@ -0,0 +1,14 @@
+"""
+Settings shared by the dashboard and the offline scripts (kept free of Streamlit imports)
+
+Author: p-robot
+"""
+
+# Columns summarised in the metric tiles
+SUMMARY_COLS = ['Incidence', 'NumberPositive', 'TotalPopulation']
+
+# Period shown when the dashboard opens
+DEFAULT_PERIOD = (1990, 2030)
+
+# Suffix of the precomputed metric tile files written by scripts/summarize.py
+SUMMARY_SUFFIX = ".summary.parquet"
@@ -5,41 +5,16 @@ App to plot output data from the PoPART-IBM model
 Author: p-robot
 """
 
-import os
 from os.path import join
-import pandas as pd
 import streamlit as st
-import altair as alt
-
-plotting_dict = {
-    'Incidence': {'name': 'HIV incidence',
-                  'var': 'Incidence',
-                  'col': '#D55E00'},
-
-    'NewCasesThisYear': {'name': 'New HIV infections',
-                         'var': 'NewCasesThisYear',
-                         'col': '#D55E00'},
-
-    'Prevalence': {'name': 'HIV prevalence',
-                   'var': 'Prevalence',
-                   'col': '#D55E00'},
-
-    'PLHIV': {'name': 'Number of people living with HIV', 
-              'var': ['NumberPositiveM', 'NumberPositiveF', 'NumberPositive'],
-              'codes': ['Men', 'Women', 'Total'],
-              'col': ["#D55E00", "#0072B2", "#009E73"]},
-
-    'HIVDeaths': {'name': 'HIV-related deaths', 
-              'var': ['NDied_from_HIV', 'NHIV_pos_dead'],
-              'codes': ['Deaths from HIV-related causes', 'Deaths of PLHIV'],
-              'col': ["#D55E00", "#0072B2"]},
-}
+from core import (plotting_dict, DEFAULT_PERIOD, MAX_TABLE_ROWS, list_output_files, 
+    load_period, load_long, summary, precomputed_summary, table_csv, downsample, 
+    build_chart, add_single_line_chart, add_multiple_line_chart)
 
 output_dir="data/examples"
 
-# List all files in the output directory
-all_files = sorted(os.listdir(output_dir))
-popart_files = [f for f in all_files if ".csv" in f]
+# List all output files in the output directory
+popart_files = list_output_files(output_dir)
 
 st.title("Output from POPART-IBM")
 st.markdown("""PopART-IBM is an individual-based model for simulating HIV epidemics
@@ -83,148 +58,99 @@ c1.metric("Country", "Zambia")
 c2.metric("Community", "5")
 c3.metric("Trial arm", "A")
 
-year_range = st.sidebar.slider("Period to show", 1970, 2030, (1990, 2030))
+# Display options are applied together, so editing them doesn't rerun the app each time
+with st.sidebar.form("controls"):
+    # Variables to display
+    vars_to_plot = st.multiselect("Variables", 
+        plotting_dict.keys(),
+        default = ['Incidence', 'NewCasesThisYear', 'PLHIV'])
 
-# Variables to display
-vars_to_plot = st.sidebar.multiselect("Variables", 
-    plotting_dict.keys(),
-    default = ['Incidence', 'NewCasesThisYear', 'PLHIV'])
+    outside_patch_on = st.toggle("Overlay surrounding area")
+    observed_on = st.toggle("Overlay observed data")
+    # Not supported - base line charts do not have vertical lines
+    #pc_ribbon_on = st.toggle("PC time periods")
 
-outside_patch_on = st.sidebar.toggle("Overlay surrounding area")
-observed_on = st.sidebar.toggle("Overlay observed data")
-# Not supported - base line charts do not have vertical lines
-#pc_ribbon_on = st.sidebar.toggle("PC time periods")
+    st.form_submit_button("Apply")
 
 st.divider()
 
-# Read data
-df = pd.read_csv(join(output_dir, option))
+# The selected output file
+path = join(output_dir, option)
 
-# Read the outside patch
-df_outside = pd.read_csv(join(output_dir, 
-    "Annual_outputs_CL04_Za_C_V1.2_patch1_Rand10_Run1_PCseed0_0_CF.csv"))
+# The outside patch
+path_outside = join(output_dir, 
+    "Annual_outputs_CL04_Za_C_V1.2_patch1_Rand10_Run1_PCseed0_0_CF.csv")
 
 
-df_plot = df[(df.Year>=year_range[0]) & (df.Year<=year_range[1])]
-if outside_patch_on:
-    df_outside = df_outside[(df_outside.Year>=year_range[0]) & (df_outside.Year<=year_range[1])]
-
-st.subheader("HIV indicators in 2030 (trial community)")
-c4, c5, c6 = st.columns(3)
-inc_inside = round(df_plot.Incidence.max()*100, 2)
-plhiv_inside = df_plot.NumberPositive.max().astype(int)
-pop_inside = df_plot.TotalPopulation.max().astype(int)
-c4.metric("Incidence (%)", inc_inside)
-c5.metric("PLHIV", plhiv_inside)
-c6.metric("Pop. size", pop_inside)
-
-if outside_patch_on:
-    st.subheader("HIV indicators in 2030 (surrounding area)")
-    c4, c5, c6 = st.columns(3)
-    inc_outside = round(df_outside.Incidence.max()*100, 2)
-    plhiv_outside = df_outside.NumberPositive.max().astype(int)
-    pop_outside = df_outside.TotalPopulation.max().astype(int)
-
-    c4.metric("Incidence (%)", inc_outside, delta = round(inc_outside - inc_inside, 2))
-    c5.metric("PLHIV", plhiv_outside, delta = int(plhiv_outside - plhiv_inside))
-    c6.metric("Pop. size", pop_outside, delta = int(pop_outside - pop_inside))
-
-
-def add_single_line_chart(data: pd.DataFrame, x: str, y: str, line_color: str) -> alt.Chart:
+@st.fragment
+def render_plots(path: str, path_outside: str, vars_to_plot: list, outside_patch_on: bool):
     """
-    Create a line chart with one variable
+    Period slider, metric tiles and charts; moving the slider only reruns this fragment
     """
-    output_chart = (alt.Chart(data).mark_line(color=line_color).encode(
-                x=alt.X(x, axis=alt.Axis(format='.0f')),
-                y = y)
-                ).configure_legend(orient='bottom')
-    return(output_chart)
+    year_range = st.slider("Period to show", 1970, 2030, DEFAULT_PERIOD)
 
+    # Read data for the period to show
+    df_plot = load_period(path, *year_range)
 
-def add_multiple_line_chart(data: pd.DataFrame, x: str, y: list, 
-                            value_name: str, var_name: str, line_color: list,
-                            codes: list) -> alt.Chart:
-    """
-    Create a line chart with multiple variables
-    """
-    # Reshape
-    df_melt = data[[x]+y].melt(
-        x,
-        value_name = value_name,
-        var_name = var_name)
-    
-    # Recode if needed
-    df_melt[var_name].replace(dict(zip(y, codes)), inplace=True)
-
-    col_var = alt.Color(var_name,
-        scale=alt.Scale(
-        domain=codes,
-        range=line_color))
-    
-    chart = (alt.Chart(df_melt).mark_line().encode(
-        x=alt.X(x, axis=alt.Axis(format='.0f')),
-        y = value_name,
-        color = col_var)
-        ).configure_legend(orient='bottom')
-    return(chart)
-
-
-# Plot HIV indicators and show data in secondary tab
-st.header("HIV indicators")
-for var in vars_to_plot:
-    # Create an expander
-    with st.expander(plotting_dict[var]['name'], expanded = True):
-        # Create two tabs
-        #tab1, tab2 = st.tabs(["Figure", "Data"])
-        st.header(plotting_dict[var]['name'])
-        # Populate figure tab
-        if isinstance(plotting_dict[var]['var'], list):
-            chart = add_multiple_line_chart(df_plot,
-                                            x = 'Year', 
-                                            y = plotting_dict[var]['var'],
-                                            value_name = 'Value',
-                                            var_name = plotting_dict[var]['name'],
-                                            line_color = plotting_dict[var]['col'],
-                                            codes = plotting_dict[var]['codes'])
-        else:
-            chart = add_single_line_chart(data = df_plot, 
-                                          x = 'Year', 
-                                          y = plotting_dict[var]['var'], 
-                                          line_color = plotting_dict[var]['col'])
+    st.subheader("HIV indicators in 2030 (trial community)")
+    c4, c5, c6 = st.columns(3)
+    inc_inside, plhiv_inside, pop_inside = summary(path, *year_range)
+    c4.metric("Incidence (%)", inc_inside)
+    c5.metric("PLHIV", plhiv_inside)
+    c6.metric("Pop. size", pop_inside)
+
+    if outside_patch_on:
+        st.subheader("HIV indicators in 2030 (surrounding area)")
+        c4, c5, c6 = st.columns(3)
+        inc_outside, plhiv_outside, pop_outside = precomputed_summary(path_outside, *year_range)
+
+        c4.metric("Incidence (%)", inc_outside, delta = round(inc_outside - inc_inside, 2))
+        c5.metric("PLHIV", plhiv_outside, delta = int(plhiv_outside - plhiv_inside))
+        c6.metric("Pop. size", pop_outside, delta = int(pop_outside - pop_inside))
+
+
+    # Plot HIV indicators and show data in secondary tab
+    st.header("HIV indicators")
+    for var in vars_to_plot:
+        # Create an expander
+        with st.expander(plotting_dict[var]['name'], expanded = True):
+            # Create two tabs
+            tab1, tab2 = st.tabs(["Figure", "Data"])
+            # Populate figure tab
+            with tab1:
+                st.header(plotting_dict[var]['name'])
+                st.altair_chart(build_chart(path, *year_range, var), use_container_width=True)
+            # Populate table tab (capped in size, full data available for download)
+            with tab2:
+                st.header(plotting_dict[var]['name'])
+                st.dataframe(df_plot[['Year']+ plotting_dict[var]['var']].tail(MAX_TABLE_ROWS), 
+                    hide_index=True, height=300)
+                st.download_button("Download CSV", 
+                    data = table_csv(path, *year_range, var),
+                    file_name = f"{var}_{year_range[0]}-{year_range[1]}.csv",
+                    mime = "text/csv",
+                    key = f"download_{var}")
+
+    st.header("Community demographics")
+
+    with st.expander("Total population size"):
+        st.header("Total population size")
+        chart = add_multiple_line_chart(data = load_long(path, *year_range),
+                                        x = 'Year',
+                                        y = ['TotalPopulation', 'PopulationF', 'PopulationM'],
+                                        codes = ['Total', 'Female', 'Male'],
+                                        var_name = "Population",
+                                        value_name = "Population size",
+                                        line_color = ["#D55E00", "#0072B2", "#009E73"])
+        st.altair_chart(chart, use_container_width=True)
+
+    with st.expander("Total deaths"):
+        st.header("Total deaths")
+        chart = add_single_line_chart(data = downsample(df_plot),
+                                        x = 'Year',
+                                        y = 'N_dead',
+                                        line_color = "#D55E00")
         st.altair_chart(chart, use_container_width=True)
-        # Populate table tab
-        # with tab2:
-        #     st.header(plotting_dict[var]['name'])
-        #     st.dataframe(df_plot[['Year']+ plotting_dict[var]['var']], hide_index=True)
-
-st.header("Community demographics")
-
-# Reshape the data
-df_pop = df_plot[['Year', 'TotalPopulation', 'PopulationF', 'PopulationM']].melt(
-    'Year', value_name = "Population size", var_name = "Population")
-
-# Recode the data
-df_pop.Population.replace(
-        {'TotalPopulation': 'Total', 
-         'PopulationF': 'Female', 
-         'PopulationM': 'Male'}, inplace=True)
-
-with st.expander("Total population size"):
-    st.header("Total population size")
-    chart = add_multiple_line_chart(data = df_plot,
-                                    x = 'Year',
-                                    y = ['TotalPopulation', 'PopulationF', 'PopulationM'],
-                                    codes = ['Total', 'Male', 'Female'],
-                                    var_name = "Population",
-                                    value_name = "Population size",
-                                    line_color = ["#D55E00", "#0072B2", "#009E73"])
-    st.altair_chart(chart, use_container_width=True)
-
-with st.expander("Total deaths"):
-    st.header("Total deaths")
-    chart = add_single_line_chart(data = df_plot,
-                                    x = 'Year',
-                                    y = 'N_dead',
-                                    line_color = "#D55E00")
-    st.altair_chart(chart, use_container_width=True)
 
+
+render_plots(path, path_outside, vars_to_plot, outside_patch_on)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Convert PopART-IBM CSV output files to Parquet for faster loading in the dashboard
+
+Usage: python3 scripts/convert_to_parquet.py [output_dir]
+
+Author: p-robot
+"""
+
+import os
+import sys
+from os.path import join, splitext
+import pandas as pd
+
+output_dir = sys.argv[1] if len(sys.argv) > 1 else "data/examples"
+
+for f in sorted(os.listdir(output_dir)):
+    if not f.endswith(".csv"):
+        continue
+    df = pd.read_csv(join(output_dir, f))
+    df.to_parquet(join(output_dir, splitext(f)[0] + ".parquet"), 
+        engine='pyarrow', index=False)
+    print("Converted", f)
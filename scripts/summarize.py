@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Precompute the dashboard's metric tiles for each PopART-IBM output file
+
+Writes <output file>.summary.parquet next to each output file: one row with the 
+maximum incidence (%), PLHIV and population size over the dashboard's default period 
+(DEFAULT_PERIOD in defaults.py).  The dashboard uses these for the surrounding-area tiles 
+when showing that period, without reading the output file.
+
+Usage: python3 scripts/summarize.py [output_dir]
+
+Author: p-robot
+"""
+
+import os
+import sys
+from os.path import join, dirname, abspath
+import pandas as pd
+
+# Share the period and file naming with the dashboard
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from defaults import SUMMARY_COLS, DEFAULT_PERIOD, SUMMARY_SUFFIX
+
+output_dir = sys.argv[1] if len(sys.argv) > 1 else "data/examples"
+start, end = DEFAULT_PERIOD
+
+cols = ['Year'] + SUMMARY_COLS
+
+for f in sorted(os.listdir(output_dir)):
+    if f.endswith(SUMMARY_SUFFIX):
+        continue
+    if f.endswith(".csv"):
+        df = pd.read_csv(join(output_dir, f))
+    elif f.endswith(".parquet"):
+        df = pd.read_parquet(join(output_dir, f))
+    else:
+        continue
+    
+    if not set(cols).issubset(df.columns):
+        print("Skipped", f, "(not an annual output file)")
+        continue
+    
+    m = df.loc[(df.Year>=start) & (df.Year<=end), cols[1:]].max()
+    pd.DataFrame({'start': [start], 'end': [end],
+        'inc': [round(float(m['Incidence'])*100, 2)],
+        'plhiv': [int(m['NumberPositive'])],
+        'pop': [int(m['TotalPopulation'])]}).to_parquet(
+            join(output_dir, f + SUMMARY_SUFFIX), engine='pyarrow', index=False)
+    print("Summarised", f)